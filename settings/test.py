@@ -16,6 +16,15 @@ DATABASES = {
             "POSTGRES_HOST", "localhost"
         ),  # noqa: ignore=F405
         "PORT": os.environ.get("POSTGRES_PORT", 5432),  # noqa: ignore=F405
+        # The test database is throwaway, so don't wait for WAL flushes on
+        # commit. Set POSTGRES_SYNCHRONOUS_COMMIT=on for prod-like runs.
+        "OPTIONS": {
+            "options": "-c synchronous_commit={}".format(
+                os.environ.get(  # noqa: ignore=F405
+                    "POSTGRES_SYNCHRONOUS_COMMIT", "off"
+                )
+            )
+        },
     }
 }
 
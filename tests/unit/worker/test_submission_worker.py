@@ -1,29 +1,36 @@
+import copy
 import os
 import shutil
 import signal
 import sys
 import tempfile
 import zipfile
+from contextlib import ExitStack, contextmanager
 from datetime import timedelta
-from io import BytesIO
+from io import BytesIO, StringIO
 from os.path import join
-from unittest.mock import MagicMock, Mock, patch
+from types import SimpleNamespace
+from unittest.mock import DEFAULT, MagicMock, Mock, patch
 
 import boto3
 import mock
+import pytest
 import responses
 from challenges.models import Challenge, ChallengePhase
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.files.base import ContentFile
-from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import FileSystemStorage
+from django.test import SimpleTestCase, TestCase
 from django.utils import timezone
 from hosts.models import ChallengeHostTeam
 from jobs.models import Submission
 from moto import mock_sqs
 from participants.models import ParticipantTeam
-from rest_framework.test import APITestCase
+from pyfakefs import fake_filesystem_unittest
+from requests.adapters import HTTPAdapter
 
+from scripts.workers import submission_worker as sw
 from scripts.workers.submission_worker import (
     PHASE_ANNOTATION_FILE_NAME_MAP,
     SUBMISSION_DATA_DIR,
@@ -49,127 +56,192 @@ from scripts.workers.submission_worker import (
 )
 from settings.common import SQS_RETENTION_PERIOD
 
+_DUMMY_BYTES = b"Dummy file content"
 
-class BaseAPITestClass(APITestCase):
-    def setUp(self):
-        self.BASE_TEMP_DIR = tempfile.mkdtemp()
 
-        self.SUBMISSION_DATA_DIR = join(
-            self.BASE_TEMP_DIR,
-            "compute/submission_files/submission_{submission_id}",
-        )
+def _dummy_upload(name="test_sample_file.txt"):
+    return ContentFile(_DUMMY_BYTES, name=name)
 
-        self.temp_directory = join(self.BASE_TEMP_DIR, "temp_dir")
 
-        self.testserver = (
-            f"http://{settings.DJANGO_SERVER}:{settings.DJANGO_SERVER_PORT}"
+def _fake_open(read_data="log content"):
+    return lambda *args, **kwargs: StringIO(read_data)
+
+
+# Built once and reset on every use; `reset_mock()` keeps the side_effect.
+_OPEN_MOCK = MagicMock(side_effect=_fake_open())
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _no_leaked_class_patches():
+    """Fail here, rather than in whichever module xdist schedules next on
+    this worker, if a class-level patch outlives its test class."""
+    save = FileSystemStorage._save
+    send = HTTPAdapter.send
+    annotation_map = dict(PHASE_ANNOTATION_FILE_NAME_MAP)
+    evaluation_scripts = dict(sw.EVALUATION_SCRIPTS)
+    yield
+    assert FileSystemStorage._save is save
+    assert HTTPAdapter.send is send
+    assert PHASE_ANNOTATION_FILE_NAME_MAP == annotation_map
+    assert sw.EVALUATION_SCRIPTS == evaluation_scripts
+
+
+@contextmanager
+def _patched_run_submission():
+    """Patch everything `run_submission` touches outside the database and
+    yield the mocks as a namespace."""
+    _OPEN_MOCK.reset_mock()
+    with ExitStack() as stack:
+        yield SimpleNamespace(
+            evaluation_scripts=stack.enter_context(
+                patch.object(sw, "EVALUATION_SCRIPTS")
+            ),
+            multiout=stack.enter_context(patch.object(sw, "MultiOut")),
+            stdout_redirect=stack.enter_context(
+                patch.object(sw, "stdout_redirect")
+            ),
+            stderr_redirect=stack.enter_context(
+                patch.object(sw, "stderr_redirect")
+            ),
+            open=stack.enter_context(patch.object(sw, "open", new=_OPEN_MOCK)),
+            rmtree=stack.enter_context(patch.object(sw.shutil, "rmtree")),
         )
-        self.url = "/test/url"
 
-        self.input_file = open(
-            join(self.BASE_TEMP_DIR, "dummy_input.txt"), "w+"
+
+class BaseAPITestClass(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Nothing reads uploaded files back from MEDIA_ROOT, so skip writing
+        # them to disk altogether.
+        # pytest never runs addClassCleanup() callbacks, so the patcher is
+        # stopped explicitly in tearDownClass() (or here, if setUpTestData()
+        # fails). It has to be active before setUpTestData() saves uploads.
+        cls._storage_patcher = patch.object(
+            FileSystemStorage, "_save", lambda self, name, content: name
         )
-        self.input_file.write("file_content")
-        self.input_file.close()
+        cls._storage_patcher.start()
+        try:
+            super().setUpClass()
+        except Exception:
+            cls._storage_patcher.stop()
+            raise
 
-        self.sqs_client = boto3.client(
-            "sqs",
-            endpoint_url=os.environ.get("AWS_SQS_ENDPOINT", "http://sqs:9324"),
-            region_name=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
-            aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY"),
-            aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID"),
+    @classmethod
+    def tearDownClass(cls):
+        try:
+            super().tearDownClass()
+        finally:
+            cls._storage_patcher.stop()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.testserver = (
+            f"http://{settings.DJANGO_SERVER}:{settings.DJANGO_SERVER_PORT}"
         )
-        self.user = User.objects.create(
+        cls.user = User.objects.create(
             username="someuser",
             email="user@test.com",
             password="secret_password",
         )
-        self.challenge_host_team = ChallengeHostTeam.objects.create(
-            team_name="Test Challenge Host Team", created_by=self.user
+        cls.challenge_host_team = ChallengeHostTeam.objects.create(
+            team_name="Test Challenge Host Team", created_by=cls.user
         )
-        self.challenge = Challenge.objects.create(
+        cls.challenge = Challenge.objects.create(
             title="Test Challenge",
             description="Description for test challenge",
             terms_and_conditions="Terms and conditions for test challenge",
             submission_guidelines="Submission guidelines for test challenge",
-            creator=self.challenge_host_team,
+            creator=cls.challenge_host_team,
             start_date=timezone.now() - timedelta(days=2),
             end_date=timezone.now() + timedelta(days=1),
             published=False,
             enable_forum=True,
             anonymous_leaderboard=False,
             max_concurrent_submission_evaluation=100,
-            evaluation_script=SimpleUploadedFile(
-                "test_sample_file.txt",
-                b"Dummy file content",
-                content_type="text/plain",
-            ),
+            evaluation_script=_dummy_upload(),
         )
 
-        self.challenge2 = Challenge.objects.create(
+        cls.challenge2 = Challenge.objects.create(
             title="Test Challenge 2",
             description="Description for test challenge 2",
             terms_and_conditions="Terms and conditions for test challenge 2",
             submission_guidelines="Submission guidelines for test challenge 2",
-            creator=self.challenge_host_team,
+            creator=cls.challenge_host_team,
             start_date=timezone.now() - timedelta(days=2),
             end_date=timezone.now() + timedelta(days=1),
             published=False,
             enable_forum=True,
             anonymous_leaderboard=False,
             max_concurrent_submission_evaluation=100,
-            evaluation_script=SimpleUploadedFile(
-                "test_sample_file.txt",
-                b"Dummy file content",
-                content_type="text/plain",
-            ),
+            evaluation_script=_dummy_upload(),
             use_host_sqs=True,
             aws_region=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
             aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY"),
             aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID"),
         )
 
-        self.participant_team = ParticipantTeam.objects.create(
-            team_name="Some Participant Team", created_by=self.user
+        cls.participant_team = ParticipantTeam.objects.create(
+            team_name="Some Participant Team", created_by=cls.user
         )
 
-        self.challenge_phase = ChallengePhase.objects.create(
+        cls.challenge_phase = ChallengePhase.objects.create(
             name="Challenge Phase",
             description="Description for Challenge Phase",
             leaderboard_public=False,
             is_public=True,
             start_date=timezone.now() - timedelta(days=2),
             end_date=timezone.now() + timedelta(days=1),
-            challenge=self.challenge,
-            test_annotation=SimpleUploadedFile(
-                "test_sample_file.txt",
-                b"Dummy file content",
-                content_type="text/plain",
-            ),
+            challenge=cls.challenge,
+            test_annotation=_dummy_upload(),
             max_submissions_per_day=100,
             max_submissions_per_month=500,
             max_submissions=1000,
             codename="Phase Code Name",
         )
 
-        self.submission = Submission.objects.create(
-            participant_team=self.participant_team,
-            challenge_phase=self.challenge_phase,
-            created_by=self.challenge_host_team.created_by,
+        cls.submission = Submission.objects.create(
+            participant_team=cls.participant_team,
+            challenge_phase=cls.challenge_phase,
+            created_by=cls.challenge_host_team.created_by,
             status="submitted",
-            input_file=SimpleUploadedFile(
-                "test_sample_file.txt",
-                b"Dummy file content",
-                content_type="text/plain",
-            ),
+            input_file=_dummy_upload(),
             method_name="Test Method",
             method_description="Test Description",
-            project_url=self.testserver,
-            publication_url=self.testserver,
+            project_url=cls.testserver,
+            publication_url=cls.testserver,
             is_public=True,
             is_flagged=True,
         )
 
+    def setUp(self):
+        # Objects built in setUpTestData() are shared by every test in the
+        # class, so hand each test its own copies to keep in-memory changes
+        # (e.g. `run_submission` updating the submission) from leaking.
+        (
+            self.challenge,
+            self.challenge2,
+            self.challenge_phase,
+            self.submission,
+        ) = copy.deepcopy(
+            (
+                self.challenge,
+                self.challenge2,
+                self.challenge_phase,
+                self.submission,
+            )
+        )
+
+        self.BASE_TEMP_DIR = tempfile.mkdtemp()
+
+        self.SUBMISSION_DATA_DIR = join(
+            self.BASE_TEMP_DIR,
+            "compute/submission_files/submission_{submission_id}",
+        )
+
+        self.temp_directory = join(self.BASE_TEMP_DIR, "temp_dir")
+
+        self.url = "/test/url"
+
         self.WORKER_LOGS_PREFIX = "WORKER_LOG"
         self.SUBMISSION_LOGS_PREFIX = "SUBMISSION_LOG"
 
@@ -200,22 +272,22 @@ class BaseAPITestClass(APITestCase):
             returned_url, "{0}{1}".format(self.testserver, self.url)
         )
 
-    @mock.patch(
-        "scripts.workers.submission_worker.create_dir_as_python_package"
-    )
-    @mock.patch("scripts.workers.submission_worker.download_and_extract_file")
+    @mock.patch.object(sw, "create_dir_as_python_package")
+    @mock.patch.object(sw, "download_and_extract_file")
     def test_extract_submission_data_success(
         self, mock_download_and_extract_file, mock_create_dir_as_python_package
     ):
         submission_input_file_path = join(
             self.SUBMISSION_DATA_DIR, "{input_file}"
         )
-        mock_submission_data_dir = mock.patch(
-            "scripts.workers.submission_worker.SUBMISSION_DATA_DIR",
+        mock_submission_data_dir = mock.patch.object(
+            sw,
+            "SUBMISSION_DATA_DIR",
             self.SUBMISSION_DATA_DIR,
         )
-        mock_submission_input_file_path = mock.patch(
-            "scripts.workers.submission_worker.SUBMISSION_INPUT_FILE_PATH",
+        mock_submission_input_file_path = mock.patch.object(
+            sw,
+            "SUBMISSION_INPUT_FILE_PATH",
             submission_input_file_path,
         )
         mock_submission_data_dir.start()
@@ -247,7 +319,7 @@ class BaseAPITestClass(APITestCase):
         mock_submission_data_dir.stop()
         mock_submission_input_file_path.stop()
 
-    @mock.patch("scripts.workers.submission_worker.logger.critical")
+    @mock.patch.object(sw.logger, "critical")
     def test_extract_submission_data_when_submission_does_not_exist(
         self, mock_logger
     ):
@@ -260,7 +332,7 @@ class BaseAPITestClass(APITestCase):
         )
         self.assertEqual(value, None)
 
-    @mock.patch("scripts.workers.submission_worker.load_challenge")
+    @mock.patch.object(sw, "load_challenge")
     def test_load_challenge_and_return_max_submissions(
         self, mocked_load_challenge
     ):
@@ -275,7 +347,7 @@ class BaseAPITestClass(APITestCase):
             ),
         )
 
-    @mock.patch("scripts.workers.submission_worker.logger.exception")
+    @mock.patch.object(sw.logger, "exception")
     def test_load_challenge_and_return_max_submissions_when_challenge_does_not_exist(
         self, mock_logger
     ):
@@ -290,7 +362,40 @@ class BaseAPITestClass(APITestCase):
                 )
             )
 
-    @mock_sqs()
+
+class GetOrCreateSqsQueueTest(BaseAPITestClass):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        try:
+            cls._sqs_mock = mock_sqs()
+            cls._sqs_mock.start()
+            try:
+                cls.sqs_client = boto3.client(
+                    "sqs",
+                    endpoint_url=os.environ.get(
+                        "AWS_SQS_ENDPOINT", "http://sqs:9324"
+                    ),
+                    region_name=os.environ.get(
+                        "AWS_DEFAULT_REGION", "us-east-1"
+                    ),
+                    aws_secret_access_key=os.environ.get(
+                        "AWS_SECRET_ACCESS_KEY"
+                    ),
+                    aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID"),
+                )
+            except Exception:
+                cls._sqs_mock.stop()
+                raise
+        except Exception:
+            super().tearDownClass()
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._sqs_mock.stop()
+        super().tearDownClass()
+
     def test_get_or_create_sqs_queue_for_existing_queue(self):
         self.sqs_client.create_queue(
             QueueName="test_queue",
@@ -303,7 +408,6 @@ class BaseAPITestClass(APITestCase):
         self.assertTrue(queue_url)
         self.sqs_client.delete_queue(QueueUrl=queue_url)
 
-    @mock_sqs()
     def test_get_or_create_sqs_queue_for_non_existing_queue(self):
         get_or_create_sqs_queue("test_queue_2")
         queue_url = self.sqs_client.get_queue_url(QueueName="test_queue_2")[
@@ -312,7 +416,6 @@ class BaseAPITestClass(APITestCase):
         self.assertTrue(queue_url)
         self.sqs_client.delete_queue(QueueUrl=queue_url)
 
-    @mock_sqs()
     def test_get_or_create_sqs_queue_for_existing_host_queue(self):
         get_or_create_sqs_queue("test_host_queue_2", self.challenge2)
         queue_url = self.sqs_client.get_queue_url(
@@ -322,22 +425,39 @@ class BaseAPITestClass(APITestCase):
         self.sqs_client.delete_queue(QueueUrl=queue_url)
 
 
-class DownloadAndExtractFileTest(BaseAPITestClass):
+class DownloadAndExtractFileTest(
+    fake_filesystem_unittest.TestCaseMixin, BaseAPITestClass
+):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        try:
+            cls._responses = responses.RequestsMock(
+                assert_all_requests_are_fired=False
+            )
+            cls._responses.start()
+        except Exception:
+            super().tearDownClass()
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._responses.stop()
+        cls._responses.reset()
+        super().tearDownClass()
+
     def setUp(self):
+        self.setUpPyfakefs()
         super(DownloadAndExtractFileTest, self).setUp()
+        self._responses.reset()
         self.req_url = "{}{}".format(self.testserver, self.url)
         self.file_content = b"file content"
 
         create_dir(self.temp_directory)
         self.download_location = join(self.temp_directory, "dummy_file")
 
-    def tearDown(self):
-        if os.path.exists(self.temp_directory):
-            shutil.rmtree(self.temp_directory)
-
-    @responses.activate
     def test_download_and_extract_file_success(self):
-        responses.add(
+        self._responses.add(
             responses.GET,
             self.req_url,
             body=self.file_content,
@@ -351,11 +471,10 @@ class DownloadAndExtractFileTest(BaseAPITestClass):
         with open(self.download_location, "rb") as f:
             self.assertEqual(f.read(), self.file_content)
 
-    @responses.activate
-    @mock.patch("scripts.workers.submission_worker.logger.error")
+    @mock.patch.object(sw.logger, "error")
     def test_download_and_extract_file_when_download_fails(self, mock_logger):
         error = "ExampleError: Example Error description"
-        responses.add(responses.GET, self.req_url, body=Exception(error))
+        self._responses.add(responses.GET, self.req_url, body=Exception(error))
         expected = "{} Failed to fetch file from {}, error {}".format(
             self.WORKER_LOGS_PREFIX, self.req_url, error
         )
@@ -366,9 +485,40 @@ class DownloadAndExtractFileTest(BaseAPITestClass):
         self.assertFalse(os.path.exists(self.download_location))
 
 
-class DownloadAndExtractZipFileTest(BaseAPITestClass):
+class DownloadAndExtractZipFileTest(
+    fake_filesystem_unittest.TestCaseMixin, BaseAPITestClass
+):
+    file_name = "test_file.txt"
+    file_content = b"file_content"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        try:
+            zip_file = BytesIO()
+            with zipfile.ZipFile(
+                zip_file, mode="w", compression=zipfile.ZIP_STORED
+            ) as zipper:
+                zipper.writestr(cls.file_name, cls.file_content)
+            cls._zip_bytes = zip_file.getvalue()
+            cls._responses = responses.RequestsMock(
+                assert_all_requests_are_fired=False
+            )
+            cls._responses.start()
+        except Exception:
+            super().tearDownClass()
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._responses.stop()
+        cls._responses.reset()
+        super().tearDownClass()
+
     def setUp(self):
+        self.setUpPyfakefs()
         super(DownloadAndExtractZipFileTest, self).setUp()
+        self._responses.reset()
         self.zip_name = "test"
         self.req_url = "{}/{}".format(self.testserver, self.zip_name)
         self.extract_location = join(self.BASE_TEMP_DIR, "test-dir")
@@ -377,26 +527,14 @@ class DownloadAndExtractZipFileTest(BaseAPITestClass):
         )
         create_dir(self.extract_location)
 
-        self.file_name = "test_file.txt"
-        self.file_content = b"file_content"
-
-        self.zip_file = BytesIO()
-        with zipfile.ZipFile(
-            self.zip_file, mode="w", compression=zipfile.ZIP_DEFLATED
-        ) as zipper:
-            zipper.writestr(self.file_name, self.file_content)
+        self.zip_file = BytesIO(self._zip_bytes)
 
-    def tearDown(self):
-        if os.path.exists(self.extract_location):
-            shutil.rmtree(self.extract_location)
-
-    @responses.activate
-    @mock.patch("scripts.workers.submission_worker.delete_zip_file")
-    @mock.patch("scripts.workers.submission_worker.extract_zip_file")
+    @mock.patch.object(sw, "delete_zip_file")
+    @mock.patch.object(sw, "extract_zip_file")
     def test_download_and_extract_zip_file_success(
         self, mock_extract_zip, mock_delete_zip
     ):
-        responses.add(
+        self._responses.add(
             responses.GET,
             self.req_url,
             content_type="application/zip",
@@ -415,13 +553,12 @@ class DownloadAndExtractZipFileTest(BaseAPITestClass):
         )
         mock_delete_zip.assert_called_with(self.download_location)
 
-    @responses.activate
-    @mock.patch("scripts.workers.submission_worker.logger.error")
+    @mock.patch.object(sw.logger, "error")
     def test_download_and_extract_zip_file_when_download_fails(
         self, mock_logger
     ):
         e = "Error description"
-        responses.add(responses.GET, self.req_url, body=Exception(e))
+        self._responses.add(responses.GET, self.req_url, body=Exception(e))
         error_message = "{} Failed to fetch file from {}, error {}".format(
             self.WORKER_LOGS_PREFIX, self.req_url, e
         )
@@ -450,7 +587,7 @@ class DownloadAndExtractZipFileTest(BaseAPITestClass):
 
         self.assertFalse(os.path.exists(self.download_location))
 
-    @mock.patch("scripts.workers.submission_worker.logger.error")
+    @mock.patch.object(sw.logger, "error")
     @mock.patch("scripts.workers.submission_worker.os.remove")
     def test_delete_zip_file_error(self, mock_remove, mock_logger):
         e = "Error description"
@@ -462,14 +599,20 @@ class DownloadAndExtractZipFileTest(BaseAPITestClass):
         delete_zip_file(self.download_location)
         mock_logger.assert_called_with(error_message)
 
-    def test_sigint_signal(self):
+
+class UtilityTests(SimpleTestCase):
+    @mock.patch.object(sw.signal, "signal")
+    def test_sigint_signal(self, mock_signal):
         killer = GracefulKiller()
-        os.kill(os.getpid(), signal.SIGINT)
+        mock_signal.assert_any_call(signal.SIGINT, killer.exit_gracefully)
+        killer.exit_gracefully(signal.SIGINT, None)
         self.assertTrue(killer.kill_now)
 
-    def test_sigterm_signal(self):
+    @mock.patch.object(sw.signal, "signal")
+    def test_sigterm_signal(self, mock_signal):
         killer = GracefulKiller()
-        os.kill(os.getpid(), signal.SIGTERM)
+        mock_signal.assert_any_call(signal.SIGTERM, killer.exit_gracefully)
+        killer.exit_gracefully(signal.SIGTERM, None)
         self.assertTrue(killer.kill_now)
 
     def test_write(self):
@@ -493,13 +636,16 @@ class DownloadAndExtractZipFileTest(BaseAPITestClass):
         with self.assertRaises(ExecutionTimeLimitExceeded):
             alarm_handler(signal.SIGALRM, None)
 
-    @mock.patch("scripts.workers.submission_worker.os.path.getctime")
-    @mock.patch("scripts.workers.submission_worker.shutil.rmtree")
-    def test_delete_old_temp_directories(self, mock_rmtree, mock_getctime):
-        # Create temporary directories
+    @mock.patch.object(sw.os, "walk")
+    @mock.patch.object(sw.os.path, "getctime")
+    @mock.patch.object(sw.shutil, "rmtree")
+    def test_delete_old_temp_directories(
+        self, mock_rmtree, mock_getctime, mock_walk
+    ):
         temp_dir = tempfile.gettempdir()
-        old_dir = tempfile.mkdtemp(prefix="tmp", dir=temp_dir)
-        new_dir = tempfile.mkdtemp(prefix="tmp", dir=temp_dir)
+        old_dir = join(temp_dir, "tmpAAA")
+        new_dir = join(temp_dir, "tmpBBB")
+        mock_walk.return_value = [(temp_dir, ["tmpAAA", "tmpBBB"], [])]
 
         # Mock creation times
         mock_getctime.side_effect = lambda path: {old_dir: 100, new_dir: 200}[
@@ -513,64 +659,53 @@ class DownloadAndExtractZipFileTest(BaseAPITestClass):
         mock_rmtree.assert_called_once_with(old_dir)
         self.assertNotIn(mock.call(new_dir), mock_rmtree.mock_calls)
 
-        # Clean up
-        shutil.rmtree(new_dir)
+
+def _patch_extract_challenge_data():
+    """Swap out the downloads, pip and module import that
+    `extract_challenge_data` performs, handing the mocks over as kwargs."""
+    return patch.multiple(
+        sw,
+        create_dir_as_python_package=DEFAULT,
+        download_and_extract_zip_file=DEFAULT,
+        create_dir=DEFAULT,
+        download_and_extract_file=DEFAULT,
+        subprocess=DEFAULT,
+        importlib=DEFAULT,
+    )
 
 
 class ExtractChallengeDataWorkerTest(BaseAPITestClass):
-    @patch("scripts.workers.submission_worker.create_dir_as_python_package")
-    @patch("scripts.workers.submission_worker.download_and_extract_zip_file")
-    @patch("scripts.workers.submission_worker.create_dir")
-    @patch("scripts.workers.submission_worker.download_and_extract_file")
-    @patch("scripts.workers.submission_worker.os.path.isfile")
-    @patch("scripts.workers.submission_worker.subprocess.check_output")
-    @patch("scripts.workers.submission_worker.importlib.import_module")
-    @patch("scripts.workers.submission_worker.importlib.invalidate_caches")
-    def test_extract_challenge_data_success(
-        self,
-        mock_invalidate_caches,
-        mock_import_module,
-        mock_check_output,
-        mock_isfile,
-        mock_download_and_extract_file,
-        mock_create_dir,
-        mock_download_and_extract_zip_file,
-        mock_create_dir_as_python_package,
-    ):
+    def setUp(self):
+        super(ExtractChallengeDataWorkerTest, self).setUp()
+        # extract_challenge_data() registers the challenge in the worker's
+        # module-level lookups; drop those entries again after each test.
+        self.addCleanup(
+            PHASE_ANNOTATION_FILE_NAME_MAP.pop, self.challenge.id, None
+        )
+        self.addCleanup(sw.EVALUATION_SCRIPTS.pop, self.challenge.id, None)
+
+    @_patch_extract_challenge_data()
+    @patch.object(sw.os.path, "isfile")
+    def test_extract_challenge_data_success(self, mock_isfile, **mocks):
         mock_isfile.return_value = False
         challenge = self.challenge
         phase = self.challenge_phase
 
         extract_challenge_data(challenge, [phase])
 
-        mock_create_dir_as_python_package.assert_called()
-        mock_download_and_extract_zip_file.assert_called()
-        mock_create_dir.assert_called()
-        mock_download_and_extract_file.assert_called()
-        mock_invalidate_caches.assert_called()
-        mock_import_module.assert_called()
+        mocks["create_dir_as_python_package"].assert_called()
+        mocks["download_and_extract_zip_file"].assert_called()
+        mocks["create_dir"].assert_called()
+        mocks["download_and_extract_file"].assert_called()
+        mocks["importlib"].invalidate_caches.assert_called()
+        mocks["importlib"].import_module.assert_called()
         self.assertIsNone(challenge.evaluation_module_error)
 
-    @patch("scripts.workers.submission_worker.create_dir_as_python_package")
-    @patch("scripts.workers.submission_worker.download_and_extract_zip_file")
-    @patch("scripts.workers.submission_worker.create_dir")
-    @patch("scripts.workers.submission_worker.download_and_extract_file")
-    @patch("scripts.workers.submission_worker.os.path.isfile")
-    @patch("scripts.workers.submission_worker.subprocess.check_output")
-    @patch("scripts.workers.submission_worker.logger.info")
-    @patch("scripts.workers.submission_worker.importlib.import_module")
-    @patch("scripts.workers.submission_worker.importlib.invalidate_caches")
+    @_patch_extract_challenge_data()
+    @patch.object(sw.os.path, "isfile")
+    @patch.object(sw.logger, "info")
     def test_extract_challenge_data_no_requirements(
-        self,
-        mock_invalidate_caches,
-        mock_import_module,
-        mock_logger_info,
-        mock_check_output,
-        mock_isfile,
-        mock_download_and_extract_file,
-        mock_create_dir,
-        mock_download_and_extract_zip_file,
-        mock_create_dir_as_python_package,
+        self, mock_logger_info, mock_isfile, **mocks
     ):
         mock_isfile.return_value = False
         challenge = self.challenge
@@ -581,62 +716,48 @@ class ExtractChallengeDataWorkerTest(BaseAPITestClass):
         mock_logger_info.assert_any_call(
             "No custom requirements for challenge {}".format(challenge.id)
         )
-        mock_import_module.assert_called()
-        mock_invalidate_caches.assert_called()
-
-    @patch("scripts.workers.submission_worker.create_dir_as_python_package")
-    @patch("scripts.workers.submission_worker.download_and_extract_zip_file")
-    @patch("scripts.workers.submission_worker.create_dir")
-    @patch("scripts.workers.submission_worker.download_and_extract_file")
-    @patch("scripts.workers.submission_worker.os.path.isfile")
-    @patch("scripts.workers.submission_worker.subprocess.check_output")
-    @patch("scripts.workers.submission_worker.logger.error")
-    @patch("scripts.workers.submission_worker.importlib.import_module")
-    @patch("scripts.workers.submission_worker.importlib.invalidate_caches")
+        mocks["importlib"].import_module.assert_called()
+        mocks["importlib"].invalidate_caches.assert_called()
+
+    @_patch_extract_challenge_data()
+    @patch.object(sw.os.path, "isfile")
+    @patch.object(sw.logger, "error")
     def test_extract_challenge_data_requirements_error(
-        self,
-        mock_invalidate_caches,
-        mock_import_module,
-        mock_logger_error,
-        mock_check_output,
-        mock_isfile,
-        mock_download_and_extract_file,
-        mock_create_dir,
-        mock_download_and_extract_zip_file,
-        mock_create_dir_as_python_package,
+        self, mock_logger_error, mock_isfile, **mocks
     ):
         mock_isfile.return_value = True
-        mock_check_output.side_effect = Exception("pip error")
+        mocks["subprocess"].check_output.side_effect = Exception("pip error")
         challenge = self.challenge
         phase = self.challenge_phase
 
         extract_challenge_data(challenge, [phase])
 
         mock_logger_error.assert_called()
-        mock_import_module.assert_called()
-        mock_invalidate_caches.assert_called()
-
-
-class RunSubmissionRemoteEvaluationTest(BaseAPITestClass):
-    @patch("scripts.workers.submission_worker.EVALUATION_SCRIPTS")
-    @patch("scripts.workers.submission_worker.MultiOut")
-    @patch("scripts.workers.submission_worker.stdout_redirect")
-    @patch("scripts.workers.submission_worker.stderr_redirect")
-    @patch(
-        "scripts.workers.submission_worker.open",
-        new_callable=mock.mock_open,
-        read_data="log content",
-    )
-    @patch("scripts.workers.submission_worker.shutil.rmtree")
-    def test_run_submission_remote_evaluation_exception_with_logs(
-        self,
-        mock_rmtree,
-        mock_open_builtin,
-        mock_stderr_redirect,
-        mock_stdout_redirect,
-        mock_multiout,
-        mock_evaluation_scripts,
-    ):
+        mocks["importlib"].import_module.assert_called()
+        mocks["importlib"].invalidate_caches.assert_called()
+
+
+class _PhaseAnnotationMapMixin:
+    """Register the fixture phase's annotation file in the worker's
+    module-level map for the lifetime of the test class."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        PHASE_ANNOTATION_FILE_NAME_MAP[cls.challenge.id] = {
+            cls.challenge_phase.id: "dummy_annotation.txt"
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        PHASE_ANNOTATION_FILE_NAME_MAP.pop(cls.challenge.id, None)
+        super().tearDownClass()
+
+
+class RunSubmissionRemoteEvaluationTest(
+    _PhaseAnnotationMapMixin, BaseAPITestClass
+):
+    def test_run_submission_remote_evaluation_exception_with_logs(self):
         challenge_id = self.challenge.id
         challenge_phase = self.challenge_phase
         submission = self.submission
@@ -647,21 +768,11 @@ class RunSubmissionRemoteEvaluationTest(BaseAPITestClass):
             SUBMISSION_DATA_DIR.format(submission_id=submission.id), "run"
         )
 
-        PHASE_ANNOTATION_FILE_NAME_MAP[challenge_id] = {
-            challenge_phase.id: "dummy_annotation.txt"
-        }
-        mock_evaluation_scripts.__getitem__.return_value.evaluate.side_effect = Exception(
-            "Eval error"
-        )
-
-        mock_evaluation_scripts.__getitem__.return_value.evaluate.side_effect = Exception(
-            "Eval error"
-        )
+        with _patched_run_submission() as mocks:
+            mocks.evaluation_scripts.__getitem__.return_value.evaluate.side_effect = Exception(
+                "Eval error"
+            )
 
-        with patch(
-            "scripts.workers.submission_worker.ContentFile",
-            side_effect=lambda x: ContentFile(x),
-        ):
             run_submission(
                 challenge_id,
                 challenge_phase,
@@ -669,33 +780,15 @@ class RunSubmissionRemoteEvaluationTest(BaseAPITestClass):
                 user_annotation_file_path,
             )
 
-        submission.refresh_from_db()
+        submission.refresh_from_db(fields=["status", "completed_at"])
         assert submission.status == Submission.FAILED
         assert submission.completed_at is not None
 
-        assert mock_open_builtin.call_count >= 4
+        assert mocks.open.call_count >= 4
 
-        mock_rmtree.assert_called_with(temp_run_dir)
+        mocks.rmtree.assert_called_with(temp_run_dir)
 
-    @patch("scripts.workers.submission_worker.EVALUATION_SCRIPTS")
-    @patch("scripts.workers.submission_worker.MultiOut")
-    @patch("scripts.workers.submission_worker.stdout_redirect")
-    @patch("scripts.workers.submission_worker.stderr_redirect")
-    @patch(
-        "scripts.workers.submission_worker.open",
-        new_callable=mock.mock_open,
-        read_data="log content",
-    )
-    @patch("scripts.workers.submission_worker.shutil.rmtree")
-    def test_run_submission_remote_evaluation_exception_logs_disabled(
-        self,
-        mock_rmtree,
-        mock_open_builtin,
-        mock_stderr_redirect,
-        mock_stdout_redirect,
-        mock_multiout,
-        mock_evaluation_scripts,
-    ):
+    def test_run_submission_remote_evaluation_exception_logs_disabled(self):
         challenge_id = self.challenge.id
         challenge_phase = self.challenge_phase
         submission = self.submission
@@ -706,21 +799,11 @@ class RunSubmissionRemoteEvaluationTest(BaseAPITestClass):
             SUBMISSION_DATA_DIR.format(submission_id=submission.id), "run"
         )
 
-        # Add this line to set up the annotation file name map
-        PHASE_ANNOTATION_FILE_NAME_MAP[challenge_id] = {
-            challenge_phase.id: "dummy_annotation.txt"
-        }
-        mock_evaluation_scripts.__getitem__.return_value.evaluate.side_effect = Exception(
-            "Eval error"
-        )
-        mock_evaluation_scripts.__getitem__.return_value.evaluate.side_effect = Exception(
-            "Eval error"
-        )
+        with _patched_run_submission() as mocks:
+            mocks.evaluation_scripts.__getitem__.return_value.evaluate.side_effect = Exception(
+                "Eval error"
+            )
 
-        with patch(
-            "scripts.workers.submission_worker.ContentFile",
-            side_effect=lambda x: ContentFile(x),
-        ):
             run_submission(
                 challenge_id,
                 challenge_phase,
@@ -728,34 +811,18 @@ class RunSubmissionRemoteEvaluationTest(BaseAPITestClass):
                 user_annotation_file_path,
             )
 
-        submission.refresh_from_db()
+        submission.refresh_from_db(fields=["status", "completed_at"])
         assert submission.status == Submission.FAILED
         assert submission.completed_at is not None
 
-        assert mock_open_builtin.call_count < 4
-        mock_rmtree.assert_called_with(temp_run_dir)
+        assert mocks.open.call_count < 4
+        mocks.rmtree.assert_called_with(temp_run_dir)
 
 
-class RunSubmissionDatasetSplitExceptionTest(BaseAPITestClass):
-    @patch("scripts.workers.submission_worker.EVALUATION_SCRIPTS")
-    @patch("scripts.workers.submission_worker.MultiOut")
-    @patch("scripts.workers.submission_worker.stdout_redirect")
-    @patch("scripts.workers.submission_worker.stderr_redirect")
-    @patch(
-        "scripts.workers.submission_worker.open",
-        new_callable=mock.mock_open,
-        read_data="log content",
-    )
-    @patch("scripts.workers.submission_worker.shutil.rmtree")
-    def test_run_submission_dataset_split_exception(
-        self,
-        mock_rmtree,
-        mock_open_builtin,
-        mock_stderr_redirect,
-        mock_stdout_redirect,
-        mock_multiout,
-        mock_evaluation_scripts,
-    ):
+class RunSubmissionDatasetSplitExceptionTest(
+    _PhaseAnnotationMapMixin, BaseAPITestClass
+):
+    def test_run_submission_dataset_split_exception(self):
         challenge_id = self.challenge.id
         challenge_phase = self.challenge_phase
         submission = self.submission
@@ -764,17 +831,14 @@ class RunSubmissionDatasetSplitExceptionTest(BaseAPITestClass):
         temp_run_dir = join(
             SUBMISSION_DATA_DIR.format(submission_id=submission.id), "run"
         )
-        PHASE_ANNOTATION_FILE_NAME_MAP[challenge_id] = {
-            challenge_phase.id: "dummy_annotation.txt"
-        }
-
-        mock_evaluation_scripts.__getitem__.return_value.evaluate.return_value = {
-            "result": [{"split_codename_1": {"key1": 10}}]
-        }
 
-        with patch(
-            "scripts.workers.submission_worker.ChallengePhaseSplit.objects.get"
+        with _patched_run_submission() as mocks, patch.object(
+            sw.ChallengePhaseSplit.objects, "get"
         ) as mock_cps_get:
+            mocks.evaluation_scripts.__getitem__.return_value.evaluate.return_value = {
+                "result": [{"split_codename_1": {"key1": 10}}]
+            }
+
             mock_cps = MagicMock()
             type(mock_cps).dataset_split = property(
                 lambda self: (_ for _ in ()).throw(
@@ -783,152 +847,149 @@ class RunSubmissionDatasetSplitExceptionTest(BaseAPITestClass):
             )
             mock_cps_get.return_value = mock_cps
 
-            with patch(
-                "scripts.workers.submission_worker.ContentFile",
-                side_effect=lambda x: ContentFile(x),
-            ):
-                run_submission(
-                    challenge_id,
-                    challenge_phase,
-                    submission,
-                    user_annotation_file_path,
-                )
+            run_submission(
+                challenge_id,
+                challenge_phase,
+                submission,
+                user_annotation_file_path,
+            )
 
-        submission.refresh_from_db()
+        submission.refresh_from_db(fields=["status", "completed_at"])
         assert submission.status == Submission.FAILED
         assert submission.completed_at is not None
 
-        mock_rmtree.assert_called_with(temp_run_dir)
+        mocks.rmtree.assert_called_with(temp_run_dir)
 
 
-class RunSubmissionLeaderboardDataTest(BaseAPITestClass):
-    @patch("scripts.workers.submission_worker.EVALUATION_SCRIPTS")
-    @patch("scripts.workers.submission_worker.MultiOut")
-    @patch("scripts.workers.submission_worker.stdout_redirect")
-    @patch("scripts.workers.submission_worker.stderr_redirect")
-    @patch(
-        "scripts.workers.submission_worker.open",
-        new_callable=mock.mock_open,
-        read_data="log content",
+@pytest.fixture(scope="module")
+def worker_ctx():
+    """In-memory stand-ins for the challenge and phase that the worker
+    functions below only read attributes from."""
+    challenge = SimpleNamespace(
+        id=1,
+        pk=1,
+        max_concurrent_submission_evaluation=100,
+        remote_evaluation=False,
     )
-    @patch("scripts.workers.submission_worker.shutil.rmtree")
-    @patch("scripts.workers.submission_worker.LeaderboardData")
-    @patch("scripts.workers.submission_worker.ChallengePhaseSplit.objects.get")
-    def test_run_submission_leaderboard_data_success(
-        self,
-        mock_cps_get,
-        mock_leaderboard_data,
-        mock_rmtree,
-        mock_open_builtin,
-        mock_stderr_redirect,
-        mock_stdout_redirect,
-        mock_multiout,
-        mock_evaluation_scripts,
-    ):
-        challenge_id = self.challenge.id
-        challenge_phase = self.challenge_phase
-        submission = self.submission
-        submission.challenge_phase.challenge.remote_evaluation = False
-        user_annotation_file_path = "dummy/path"
-        temp_run_dir = join(
-            SUBMISSION_DATA_DIR.format(submission_id=submission.id), "run"
+    challenge_phase = SimpleNamespace(
+        id=1,
+        codename="Phase Code Name",
+        disable_logs=False,
+        challenge=challenge,
+    )
+    return SimpleNamespace(
+        challenge=challenge, challenge_phase=challenge_phase
+    )
+
+
+@pytest.fixture
+def submission(worker_ctx):
+    # `run_submission` sets status/completed_at on the instance before each
+    # `save()`, so a MagicMock records the final values without a DB row.
+    return MagicMock(
+        id=1,
+        pk=1,
+        status=Submission.SUBMITTED,
+        completed_at=None,
+        challenge_phase=worker_ctx.challenge_phase,
+    )
+
+
+@pytest.fixture
+def patched_worker():
+    """`_patched_run_submission` plus the leaderboard and serializer
+    lookups that the non-remote `run_submission` path goes through."""
+    with _patched_run_submission() as mocks, ExitStack() as stack:
+        mocks.leaderboard_data = stack.enter_context(
+            patch.object(sw, "LeaderboardData")
         )
-        PHASE_ANNOTATION_FILE_NAME_MAP[challenge_id] = {
-            challenge_phase.id: "dummy_annotation.txt"
-        }
+        mocks.cps_get = stack.enter_context(
+            patch.object(sw.ChallengePhaseSplit.objects, "get")
+        )
+        mocks.submission_serializer = stack.enter_context(
+            patch.object(sw, "SubmissionSerializer")
+        )
+        yield mocks
 
-        mock_evaluation_scripts.__getitem__.return_value.evaluate.return_value = {
-            "result": [{"split_codename_1": {"key1": 10}}]
-        }
 
-        mock_cps = MagicMock()
-        mock_cps.leaderboard = MagicMock()
-        mock_cps.dataset_split.codename = "split_codename_1"
-        mock_cps_get.return_value = mock_cps
+@pytest.fixture(scope="class")
+def phase_annotation_map(worker_ctx):
+    PHASE_ANNOTATION_FILE_NAME_MAP[worker_ctx.challenge.id] = {
+        worker_ctx.challenge_phase.id: "dummy_annotation.txt"
+    }
+    yield
+    PHASE_ANNOTATION_FILE_NAME_MAP.pop(worker_ctx.challenge.id, None)
 
-        with patch(
-            "scripts.workers.submission_worker.ContentFile",
-            side_effect=lambda x: ContentFile(x),
-        ):
-            run_submission(
-                challenge_id,
-                challenge_phase,
-                submission,
-                user_annotation_file_path,
-            )
 
-        assert mock_leaderboard_data.call_count >= 1
-        submission.refresh_from_db()
-        assert submission.status in [Submission.FINISHED, Submission.FAILED]
-        assert submission.completed_at is not None
-        mock_rmtree.assert_called_with(temp_run_dir)
-
-    @patch("scripts.workers.submission_worker.EVALUATION_SCRIPTS")
-    @patch("scripts.workers.submission_worker.MultiOut")
-    @patch("scripts.workers.submission_worker.stdout_redirect")
-    @patch("scripts.workers.submission_worker.stderr_redirect")
-    @patch(
-        "scripts.workers.submission_worker.open",
-        new_callable=mock.mock_open,
-        read_data="log content",
+@pytest.mark.usefixtures("phase_annotation_map")
+class TestRunSubmission:
+    @pytest.mark.parametrize(
+        "evaluate_result, evaluate_exc, expected_status",
+        [
+            (
+                {"result": [{"split_codename_1": {"key1": 10}}]},
+                None,
+                Submission.FINISHED,
+            ),
+            (
+                {
+                    "result": [{"split_codename_1": {"key1": 10}}],
+                    "error": [{"split_codename_1": {"errorkey": 1}}],
+                },
+                None,
+                Submission.FINISHED,
+            ),
+            (None, Exception("Eval error"), Submission.FAILED),
+        ],
+        ids=["leaderboard_data", "leaderboard_data_with_error", "eval_error"],
     )
-    @patch("scripts.workers.submission_worker.shutil.rmtree")
-    @patch("scripts.workers.submission_worker.LeaderboardData")
-    @patch("scripts.workers.submission_worker.ChallengePhaseSplit.objects.get")
-    def test_run_submission_leaderboard_data_with_error(
+    def test_run_submission(
         self,
-        mock_cps_get,
-        mock_leaderboard_data,
-        mock_rmtree,
-        mock_open_builtin,
-        mock_stderr_redirect,
-        mock_stdout_redirect,
-        mock_multiout,
-        mock_evaluation_scripts,
+        evaluate_result,
+        evaluate_exc,
+        expected_status,
+        patched_worker,
+        worker_ctx,
+        submission,
     ):
-        challenge_id = self.challenge.id
-        challenge_phase = self.challenge_phase
-        submission = self.submission
-        submission.challenge_phase.challenge.remote_evaluation = False
+        challenge_id = worker_ctx.challenge.id
+        challenge_phase = worker_ctx.challenge_phase
         user_annotation_file_path = "dummy/path"
         temp_run_dir = join(
             SUBMISSION_DATA_DIR.format(submission_id=submission.id), "run"
         )
-        PHASE_ANNOTATION_FILE_NAME_MAP[challenge_id] = {
-            challenge_phase.id: "dummy_annotation.txt"
-        }
 
-        mock_evaluation_scripts.__getitem__.return_value.evaluate.return_value = {
-            "result": [{"split_codename_1": {"key1": 10}}],
-            "error": [{"split_codename_1": {"errorkey": 1}}],
-        }
+        evaluate = (
+            patched_worker.evaluation_scripts.__getitem__.return_value.evaluate
+        )
+        if evaluate_exc:
+            evaluate.side_effect = evaluate_exc
+        else:
+            evaluate.return_value = evaluate_result
 
         mock_cps = MagicMock()
         mock_cps.leaderboard = MagicMock()
         mock_cps.dataset_split.codename = "split_codename_1"
-        mock_cps_get.return_value = mock_cps
+        patched_worker.cps_get.return_value = mock_cps
 
-        with patch(
-            "scripts.workers.submission_worker.ContentFile",
-            side_effect=lambda x: ContentFile(x),
-        ):
-            run_submission(
-                challenge_id,
-                challenge_phase,
-                submission,
-                user_annotation_file_path,
-            )
+        run_submission(
+            challenge_id,
+            challenge_phase,
+            submission,
+            user_annotation_file_path,
+        )
 
-        assert mock_leaderboard_data.call_count >= 1
-        submission.refresh_from_db()
-        assert submission.status in [Submission.FINISHED, Submission.FAILED]
+        if not evaluate_exc:
+            assert patched_worker.leaderboard_data.call_count >= 1
+        submission.save.assert_called()
+        assert submission.status == expected_status
         assert submission.completed_at is not None
-        mock_rmtree.assert_called_with(temp_run_dir)
+        patched_worker.rmtree.assert_called_with(temp_run_dir)
 
 
-class ProcessAddChallengeMessageTest(BaseAPITestClass):
-    @patch("scripts.workers.submission_worker.extract_challenge_data")
-    @patch("scripts.workers.submission_worker.Challenge.objects.get")
+class TestProcessAddChallengeMessage:
+    @patch.object(sw, "extract_challenge_data")
+    @patch.object(sw.Challenge.objects, "get")
     def test_process_add_challenge_message_success(
         self, mock_challenge_get, mock_extract_challenge_data
     ):
@@ -944,8 +1005,8 @@ class ProcessAddChallengeMessageTest(BaseAPITestClass):
             mock_challenge, mock_challenge.challengephase_set.all.return_value
         )
 
-    @patch("scripts.workers.submission_worker.logger.exception")
-    @patch("scripts.workers.submission_worker.Challenge.objects.get")
+    @patch.object(sw.logger, "exception")
+    @patch.object(sw.Challenge.objects, "get")
     def test_process_add_challenge_message_challenge_does_not_exist(
         self, mock_challenge_get, mock_logger_exception
     ):
@@ -962,213 +1023,112 @@ class ProcessAddChallengeMessageTest(BaseAPITestClass):
         )
 
 
-class RunSubmissionEvaluationExceptionTest(BaseAPITestClass):
-    @patch("scripts.workers.submission_worker.EVALUATION_SCRIPTS")
-    @patch("scripts.workers.submission_worker.MultiOut")
-    @patch("scripts.workers.submission_worker.stdout_redirect")
-    @patch("scripts.workers.submission_worker.stderr_redirect")
-    @patch(
-        "scripts.workers.submission_worker.open",
-        new_callable=mock.mock_open,
-        read_data="log content",
-    )
-    @patch("scripts.workers.submission_worker.shutil.rmtree")
-    def test_run_submission_evaluation_exception(
-        self,
-        mock_rmtree,
-        mock_open_builtin,
-        mock_stderr_redirect,
-        mock_stdout_redirect,
-        mock_multiout,
-        mock_evaluation_scripts,
-    ):
-        challenge_id = self.challenge.id
-        challenge_phase = self.challenge_phase
-        submission = self.submission
-        submission.challenge_phase.challenge.remote_evaluation = False
-        user_annotation_file_path = "dummy/path"
-        temp_run_dir = join(
-            SUBMISSION_DATA_DIR.format(submission_id=submission.id), "run"
+@pytest.fixture
+def main_env():
+    """Stub out everything `main()` reaches for at start-up and hand back
+    a queue holding one message, with the killer set to stop the loop
+    after a single pass."""
+    with ExitStack() as stack:
+        env = SimpleNamespace(
+            import_module=stack.enter_context(
+                patch.object(sw.importlib, "import_module")
+            ),
+            invalidate_caches=stack.enter_context(
+                patch.object(sw.importlib, "invalidate_caches")
+            ),
+            GracefulKiller=stack.enter_context(
+                patch.object(sw, "GracefulKiller")
+            ),
+            logger_info=stack.enter_context(patch.object(sw.logger, "info")),
+            delete_old_temp_directories=stack.enter_context(
+                patch.object(sw, "delete_old_temp_directories")
+            ),
+            create_dir_as_python_package=stack.enter_context(
+                patch.object(sw, "create_dir_as_python_package")
+            ),
+            load_challenge=stack.enter_context(
+                patch.object(sw, "load_challenge")
+            ),
+            load_challenge_and_return_max_submissions=stack.enter_context(
+                patch.object(sw, "load_challenge_and_return_max_submissions")
+            ),
+            get_or_create_sqs_queue=stack.enter_context(
+                patch.object(sw, "get_or_create_sqs_queue")
+            ),
+            process_submission_callback=stack.enter_context(
+                patch.object(sw, "process_submission_callback")
+            ),
+            Challenge=stack.enter_context(patch.object(sw, "Challenge")),
+            Submission=stack.enter_context(patch.object(sw, "Submission")),
+            settings=stack.enter_context(patch.object(sw, "settings")),
+            sleep=stack.enter_context(
+                patch.object(sw.time, "sleep", return_value=None)
+            ),
         )
-        PHASE_ANNOTATION_FILE_NAME_MAP[challenge_id] = {
-            challenge_phase.id: "dummy_annotation.txt"
-        }
-
-        # Simulate evaluate raising exception
-        mock_evaluation_scripts.__getitem__.return_value.evaluate.side_effect = Exception(
-            "Eval error"
+        stack.enter_context(patch.object(sys, "argv", ["worker"]))
+
+        env.settings.DEBUG = True
+        env.settings.TEST = False
+        env.GracefulKiller.return_value.kill_now = True
+        env.message = MagicMock()
+        env.message.body = (
+            '{"is_static_dataset_code_upload_submission": false}'
         )
+        env.queue = MagicMock()
+        env.queue.receive_messages.return_value = [env.message]
+        env.get_or_create_sqs_queue.return_value = env.queue
+        yield env
 
-        with patch(
-            "scripts.workers.submission_worker.ContentFile",
-            side_effect=lambda x: ContentFile(x),
-        ):
-            run_submission(
-                challenge_id,
-                challenge_phase,
-                submission,
-                user_annotation_file_path,
-            )
-
-        submission.refresh_from_db()
-        assert submission.status == Submission.FAILED
-        assert submission.completed_at is not None
-        mock_rmtree.assert_called_with(temp_run_dir)
-
-
-class MainFunctionTest(BaseAPITestClass):
-    @patch("scripts.workers.submission_worker.importlib.import_module")
-    @patch("scripts.workers.submission_worker.importlib.invalidate_caches")
-    @patch("scripts.workers.submission_worker.GracefulKiller")
-    @patch("scripts.workers.submission_worker.logger.info")
-    @patch("scripts.workers.submission_worker.delete_old_temp_directories")
-    @patch("scripts.workers.submission_worker.create_dir_as_python_package")
-    @patch(
-        "scripts.workers.submission_worker.load_challenge_and_return_max_submissions"
-    )
-    @patch("scripts.workers.submission_worker.get_or_create_sqs_queue")
-    @patch("scripts.workers.submission_worker.process_submission_callback")
-    @patch("scripts.workers.submission_worker.Submission")
-    def test_main_debug_limit_concurrent(
-        self,
-        mock_Submission,
-        mock_process_submission_callback,
-        mock_get_or_create_sqs_queue,
-        mock_load_challenge_and_return_max_submissions,
-        mock_create_dir_as_python_package,
-        mock_delete_old_temp_directories,
-        mock_logger_info,
-        mock_GracefulKiller,
-        mock_invalidate_caches,
-        mock_import_module,
-    ):
-        with patch.object(sys, "argv", ["worker"]), patch(
-            "scripts.workers.submission_worker.settings"
-        ) as mock_settings, patch(
-            "scripts.workers.submission_worker.time.sleep", return_value=None
-        ):
-            mock_settings.DEBUG = True
-            mock_settings.TEST = False
-
-            with patch.dict(
-                "os.environ",
-                {
-                    "LIMIT_CONCURRENT_SUBMISSION_PROCESSING": "True",
-                    "CHALLENGE_PK": str(self.challenge.pk),
-                },
-            ):
-                killer_instance = MagicMock()
-                killer_instance.kill_now = True
-                mock_GracefulKiller.return_value = killer_instance
-                mock_load_challenge_and_return_max_submissions.return_value = (
-                    1,
-                    self.challenge,
-                )
-                mock_queue = MagicMock()
-                mock_message = MagicMock()
-                mock_message.body = (
-                    '{"is_static_dataset_code_upload_submission": false}'
-                )
-                mock_queue.receive_messages.return_value = [mock_message]
-                mock_get_or_create_sqs_queue.return_value = mock_queue
-                mock_Submission.objects.filter.return_value.count.return_value = (
-                    0
-                )
-
-                main()
 
-                assert any(
-                    str(call_args[0][0]).startswith("WORKER_LOG Using ")
-                    for call_args in mock_logger_info.call_args_list
-                )
-                mock_delete_old_temp_directories.assert_called()
-                mock_create_dir_as_python_package.assert_any_call(mock.ANY)
-                mock_get_or_create_sqs_queue.assert_called()
-                mock_queue.receive_messages.assert_called_with(
-                    WaitTimeSeconds=20
-                )
-                mock_process_submission_callback.assert_called_with(
-                    mock_message.body
-                )
-
-    @patch("scripts.workers.submission_worker.importlib.import_module")
-    @patch("scripts.workers.submission_worker.importlib.invalidate_caches")
-    @patch("scripts.workers.submission_worker.GracefulKiller")
-    @patch("scripts.workers.submission_worker.logger.info")
-    @patch("scripts.workers.submission_worker.delete_old_temp_directories")
-    @patch("scripts.workers.submission_worker.create_dir_as_python_package")
-    @patch(
-        "scripts.workers.submission_worker.load_challenge_and_return_max_submissions"
-    )
-    @patch("scripts.workers.submission_worker.get_or_create_sqs_queue")
-    @patch("scripts.workers.submission_worker.process_submission_callback")
-    @patch("scripts.workers.submission_worker.Submission")
-    def test_main_debug_no_limit_concurrent(
-        self,
-        mock_Submission,
-        mock_process_submission_callback,
-        mock_get_or_create_sqs_queue,
-        mock_load_challenge_and_return_max_submissions,
-        mock_create_dir_as_python_package,
-        mock_delete_old_temp_directories,
-        mock_logger_info,
-        mock_GracefulKiller,
-        mock_invalidate_caches,
-        mock_import_module,
+class TestMainFunction:
+    @pytest.mark.parametrize("limit_concurrent", ["True", "False"])
+    def test_main_debug(
+        self, limit_concurrent, main_env, worker_ctx, monkeypatch
     ):
-        with patch.object(sys, "argv", ["worker"]), patch(
-            "scripts.workers.submission_worker.settings"
-        ) as mock_settings, patch(
-            "scripts.workers.submission_worker.time.sleep", return_value=None
-        ), patch(
-            "scripts.workers.submission_worker.Challenge"
-        ) as mock_Challenge:
-            mock_settings.DEBUG = True
-            mock_settings.TEST = False
-            with patch.dict(
-                "os.environ",
-                {"LIMIT_CONCURRENT_SUBMISSION_PROCESSING": "False"},
-            ):
-                killer_instance = MagicMock()
-                killer_instance.kill_now = True
-                mock_GracefulKiller.return_value = killer_instance
-                mock_challenge = MagicMock()
-                mock_Challenge.objects.filter.return_value = [mock_challenge]
-                mock_queue = MagicMock()
-                mock_message = MagicMock()
-                mock_message.body = (
-                    '{"is_static_dataset_code_upload_submission": false}'
-                )
-                mock_queue.receive_messages.return_value = [mock_message]
-                mock_get_or_create_sqs_queue.return_value = mock_queue
+        # The worker reads LIMIT_CONCURRENT_SUBMISSION_PROCESSING from the
+        # environment at import time, so set the module constant itself.
+        monkeypatch.setattr(
+            sw, "LIMIT_CONCURRENT_SUBMISSION_PROCESSING", limit_concurrent
+        )
+        monkeypatch.setenv("CHALLENGE_PK", str(worker_ctx.challenge.pk))
+        main_env.load_challenge_and_return_max_submissions.return_value = (
+            1,
+            worker_ctx.challenge,
+        )
+        main_env.Challenge.objects.filter.return_value = [worker_ctx.challenge]
+        main_env.Submission.objects.filter.return_value.count.return_value = 0
 
-                main()
+        main()
 
-                assert any(
-                    str(call_args[0][0]).startswith("WORKER_LOG Using ")
-                    for call_args in mock_logger_info.call_args_list
-                )
-                mock_delete_old_temp_directories.assert_called()
-                mock_create_dir_as_python_package.assert_any_call(mock.ANY)
-                mock_get_or_create_sqs_queue.assert_called()
-                mock_queue.receive_messages.assert_called_with(
-                    WaitTimeSeconds=20
-                )
-                mock_process_submission_callback.assert_called_with(
-                    mock_message.body
-                )
+        if limit_concurrent == "True":
+            main_env.load_challenge_and_return_max_submissions.assert_called()
+        else:
+            main_env.load_challenge.assert_called_with(worker_ctx.challenge)
+        assert any(
+            str(call_args[0][0]).startswith("WORKER_LOG Using ")
+            for call_args in main_env.logger_info.call_args_list
+        )
+        main_env.delete_old_temp_directories.assert_called()
+        main_env.create_dir_as_python_package.assert_any_call(mock.ANY)
+        main_env.get_or_create_sqs_queue.assert_called()
+        main_env.queue.receive_messages.assert_called_with(WaitTimeSeconds=20)
+        main_env.process_submission_callback.assert_called_with(
+            main_env.message.body
+        )
 
 
-class DeleteOldTempDirectoriesTest(BaseAPITestClass):
-    @patch("scripts.workers.submission_worker.logger.info")
-    @patch("scripts.workers.submission_worker.shutil.rmtree")
-    @patch("scripts.workers.submission_worker.os.path.getctime")
+class TestDeleteOldTempDirectories:
+    @patch.object(sw.logger, "info")
+    @patch.object(sw.shutil, "rmtree")
+    @patch.object(sw.os.path, "getctime")
+    @patch.object(sw.os, "walk")
     def test_delete_old_temp_directories_delete_error(
-        self, mock_getctime, mock_rmtree, mock_logger_info
+        self, mock_walk, mock_getctime, mock_rmtree, mock_logger_info
     ):
         temp_dir = tempfile.gettempdir()
-        dir1 = tempfile.mkdtemp(prefix="tmp", dir=temp_dir)
-        dir2 = tempfile.mkdtemp(prefix="tmp", dir=temp_dir)
+        dir1 = join(temp_dir, "tmpAAAA")
+        dir2 = join(temp_dir, "tmpBBBB")
+        mock_walk.return_value = [(temp_dir, ["tmpAAAA", "tmpBBBB"], [])]
 
         mock_getctime.side_effect = lambda path: {dir1: 100, dir2: 200}[path]
 
@@ -1186,13 +1146,10 @@ class DeleteOldTempDirectoriesTest(BaseAPITestClass):
             for call_args in mock_logger_info.call_args_list
         )
 
-        if os.path.exists(dir2):
-            shutil.rmtree(dir2)
-
 
-class ExtractSubmissionDataCancelledTest(BaseAPITestClass):
-    @patch("scripts.workers.submission_worker.logger.info")
-    @patch("scripts.workers.submission_worker.Submission.objects.get")
+class TestExtractSubmissionDataCancelled:
+    @patch.object(sw.logger, "info")
+    @patch.object(sw.Submission.objects, "get")
     def test_extract_submission_data_cancelled(
         self, mock_submission_get, mock_logger_info
     ):